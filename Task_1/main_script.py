@@ -4,17 +4,111 @@
 базой данных PostgreSQL, а также запись полученных данных в базу данных.
 """
 
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
+import functools
+import hashlib
+import io
+import json
+import os
 import subprocess
+import sys
 import time
 
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
+import httpx
+import numpy as np
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
 from dateutil.relativedelta import relativedelta
 import pandas as pd
 from sqlalchemy import create_engine, text
 
+# Адрес Open-Meteo API, запрашиваемые ежедневные показатели и часовой пояс данных
+API_URL = "https://historical-forecast-api.open-meteo.com/v1/forecast"
+DAILY_VARIABLES = ["weather_code", "temperature_2m_max", "temperature_2m_min",
+    "apparent_temperature_max", "apparent_temperature_min", "wind_speed_10m_max"]
+TIMEZONE = "Europe/Moscow"
+
+# Повтор запросов к API: число повторов, коэффициент задержки (в секундах) и статусы для повтора
+RETRIES = 5
+BACKOFF_FACTOR = 0.2
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Папка и время жизни (в секундах) кэша полученных данных о погоде
+CACHE_DIR = ".cache"
+CACHE_EXPIRE_AFTER = 3600
+
+# Названия месяцев в родительном падеже, индекс совпадает с номером месяца
+_MONTHS_RU = np.array(["", "января", "февраля", "марта", "апреля", "мая", "июня", "июля",
+    "августа", "сентября", "октября", "ноября", "декабря"], dtype=object)
+
+# Таблица для данных о погоде и заранее подготовленные SQL-запросы к ней
+TABLE_NAME = "daily_weather"
+
+_DDL_DAILY = text("""
+    CREATE TABLE IF NOT EXISTS daily_weather (
+        date DATE PRIMARY KEY,
+        weather_code SMALLINT,
+        temperature_2m_max REAL,
+        temperature_2m_min REAL,
+        apparent_temperature_max REAL,
+        apparent_temperature_min REAL,
+        wind_speed_10m_max REAL
+    );
+""")
+# Столбцы daily_weather в порядке загрузки и их типы, как их показывает information_schema
+_DAILY_COLUMN_TYPES = {
+    "date": "date",
+    "weather_code": "smallint",
+    "temperature_2m_max": "real",
+    "temperature_2m_min": "real",
+    "apparent_temperature_max": "real",
+    "apparent_temperature_min": "real",
+    "wind_speed_10m_max": "real"
+}
+_TABLE_COLUMNS = text("""
+    SELECT column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = :name;
+""")
+_HAS_PRIMARY_KEY = text("""
+    SELECT EXISTS (
+        SELECT 1
+        FROM pg_constraint
+        WHERE conrelid = to_regclass(:name) AND contype = 'p'
+    );
+""")
+_DROP_DAILY = text("DROP TABLE daily_weather;")
+_CHECK_TABLE = text("SELECT to_regclass(:name) IS NOT NULL;")
+_TRUNCATE_DAILY = text("TRUNCATE daily_weather;")
+_COPY_DAILY = f"COPY daily_weather ({', '.join(_DAILY_COLUMN_TYPES)}) FROM STDIN WITH CSV"
+_STATS_DAILY = text("""
+    WITH counts AS (
+        SELECT
+            count(*) FILTER (WHERE weather_code IN (0, 1)) AS sunny_days,
+            count(*) FILTER (WHERE temperature_2m_max >= 20) AS hot_days
+        FROM daily_weather
+    ),
+    top_dates AS (
+        SELECT date, temperature_2m_max
+        FROM (
+            (SELECT date, temperature_2m_max FROM daily_weather
+             WHERE temperature_2m_max IS NOT NULL
+             ORDER BY temperature_2m_max DESC LIMIT 3)
+            UNION
+            (SELECT date, temperature_2m_max FROM daily_weather
+             WHERE wind_speed_10m_max IS NOT NULL
+             ORDER BY wind_speed_10m_max DESC LIMIT 3)
+        ) AS candidates
+        WHERE temperature_2m_max IS NOT NULL
+        ORDER BY temperature_2m_max DESC
+        LIMIT 3
+    )
+    SELECT counts.sunny_days, counts.hot_days, top_dates.date
+    FROM counts
+    LEFT JOIN top_dates ON TRUE
+    ORDER BY top_dates.temperature_2m_max DESC NULLS LAST;
+""")
+
 def launch_container(container_name, db_name, db_user, db_password, db_port, db_port_a):
     """
     Запускает контейнер PostgreSQL с использованием Docker Compose.
@@ -25,11 +119,9 @@ def launch_container(container_name, db_name, db_user, db_password, db_port, db_
     :param db_password: Пароль пользователя базы данных.
     :param db_port: Порт, на котором будет доступен контейнер.
 
-    :raises RuntimeError: Если контейнер не был запущен после 3 попыток.
+    :raises RuntimeError: Если Docker Compose завершился с ошибкой или база данных
+        в контейнере не стала доступна за 60 секунд.
     """
-    # Установка переменных
-    retry_count = 0
-
     # Установка параметром контейнейра
     docker_compose_content = f"""
     services:
@@ -46,78 +138,223 @@ def launch_container(container_name, db_name, db_user, db_password, db_port, db_
           - "{db_port_a}:{db_port}"
         volumes:
           - pg_data:/var/lib/postgresql/data
+        healthcheck:
+          test: ["CMD-SHELL", "pg_isready -U {db_user} -d {db_name}"]
+          interval: 30s
+          start_period: 30s
+          start_interval: 1s
+          retries: 5
 
     volumes:
       pg_data:
     """
 
-    # Запись docker-compose.yml файла в вирткальное окружение
-    with open("docker-compose.yml", "w", encoding="utf-8") as file:
-        file.write(docker_compose_content)
-
-    # Запуск Docker Compose для поднятия контейнера
-    print("Запуск контейнера Postgres через Docker Compose...")
-    subprocess.run(["docker-compose", "up", "-d"], check=True)
-
-    # Ожидание запуска контейнера
-    print("Ожидание запуска контейнера Postgres (примерно 10 секунд)...")
-    time.sleep(10)
-
-    # Проверка, что контейнер запущен
-    while retry_count <= 2:
-
-        try:
-            result = subprocess.run(
-                ["docker", "ps", "--filter", "name=postgres_weather", "--format", "{{.Names}}"],
-                capture_output=True, text=True, check=True
-            )
-
-            # Проверка вывода команды
-            if container_name in result.stdout:
-                print(f"Контейнер {container_name} запущен.")
-                return "Success"
-            else:
-                print(f"Контейнер {container_name} не запущен. Повторная проверка через 10 секунд.")
-                retry_count += 1
-                time.sleep(10)
-                continue
-        except subprocess.CalledProcessError as e:
-            print(f"Ошибка при проверке состояния контейнера: {e}")
-
-    # Если контейнер не запустился после трёх попыток, поднимаем исключение
-    raise RuntimeError(f"""Контейнер {container_name} не был запущен после 3 попыток.
+    # Контрольная сумма конфигурации в первой строке файла
+    config_hash = hashlib.sha256(docker_compose_content.encode("utf-8")).hexdigest()
+    docker_compose_content = f"# sha256: {config_hash}\n{docker_compose_content}"
+
+    # Запись docker-compose.yml файла в вирткальное окружение, только если конфигурация изменилась.
+    # Файл записывается во временный и атомарно заменяет старый
+    current_content = None
+    if os.path.exists("docker-compose.yml"):
+        with open("docker-compose.yml", encoding="utf-8") as file:
+            current_content = file.read()
+    if docker_compose_content != current_content:
+        with open("docker-compose.yml.tmp", "w", encoding="utf-8") as file:
+            file.write(docker_compose_content)
+        os.replace("docker-compose.yml.tmp", "docker-compose.yml")
+
+    # Запуск Docker Compose для поднятия контейнера. Флаг --wait дожидается,
+    # пока healthcheck (pg_isready) не сообщит о готовности базы данных
+    print("Запуск контейнера Postgres через Docker Compose и ожидание готовности базы данных...")
+    # Docker Compose пишет ход загрузки образа и запуска в stderr: выводим его сразу
+    # и сохраняем, чтобы показать в сообщении об ошибке
+    compose_process = subprocess.Popen(
+        ["docker-compose", "up", "-d", "--wait", "--wait-timeout", "60"],
+        stderr=subprocess.PIPE, text=True
+    )
+    compose_output = []
+    for line in compose_process.stderr:
+        print(line, end="", file=sys.stderr)
+        compose_output.append(line)
+
+    # Если контейнер не запустился или база данных не стала доступна, поднимаем исключение
+    if compose_process.wait() != 0:
+        raise RuntimeError(f"""Контейнер {container_name} не был запущен или база данных не стала доступна.
     Проверьте параметры запуска.
-    """)
+    {"".join(compose_output)}""")
 
-def get_weather_data(months):
-    """
-    Получает исторические данные о погоде за указанные месяцы.
+    print(f"Контейнер {container_name} запущен.")
+    return "Success"
 
-    :param months: Количество месяцев, за которые необходимо получить данные о погоде.
-    :return: DataFrame с данными о погоде.
+def _build_params(start_date, end_date, latitude, longitude):
     """
-    # Поднимаем клиента Open-Meteo API client с кэшированием и перезапуском в случае ощибок
-    cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
-    retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-    openmeteo = openmeteo_requests.Client(session = retry_session)
+    Формирует параметры запроса к Open-Meteo API.
 
-    # Определяем переменные
-    start_date = (datetime.now() - relativedelta(months=months)).strftime("%Y-%m-%d")
-    end_date = datetime.now().strftime("%Y-%m-%d")
-
-    # Устанавливаем параметры запроса
-    url = "https://historical-forecast-api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": 59.9375,
-        "longitude": 30.308611,
+    :param start_date: Начальная дата периода в формате YYYY-MM-DD.
+    :param end_date: Конечная дата периода в формате YYYY-MM-DD.
+    :param latitude: Широта точки.
+    :param longitude: Долгота точки.
+    :return: Словарь с параметрами запроса.
+    """
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
         "start_date": start_date,
         "end_date": end_date,
-        "daily": ["weather_code", "temperature_2m_max", "temperature_2m_min", \
-            "apparent_temperature_max", "apparent_temperature_min", "wind_speed_10m_max"],
+        "daily": ",".join(DAILY_VARIABLES),
         "wind_speed_unit": "ms",
-        "timezone": "Europe/Moscow"
+        "timezone": TIMEZONE,
+        "format": "flatbuffers"
+    }
+
+def _decode_responses(content):
+    """
+    Разбирает ответ Open-Meteo API в формате flatbuffers.
+
+    Ответ состоит из одного или нескольких сообщений, каждому из которых
+    предшествует его длина (4 байта, little-endian).
+
+    :param content: Тело ответа в байтах.
+    :return: Список объектов WeatherApiResponse.
+
+    :raises RuntimeError: Если вместо сообщения в потоке пришёл текст ошибки.
+    """
+    responses = []
+    position = 0
+    while position < len(content):
+        length = int.from_bytes(content[position:position + 4], "little")
+        # Ошибка посреди потока приходит текстом вместо длины сообщения, он начинается с "Unex(pected)"
+        if length == 0x78656E55:
+            raise RuntimeError(f"Ошибка Open-Meteo API: {content[position:].decode('utf-8', errors='replace')}")
+        responses.append(WeatherApiResponse.GetRootAs(content, position + 4))
+        position += length + 4
+    return responses
+
+async def _get_with_retry(client, params):
+    """
+    Выполняет запрос к Open-Meteo API, повторяя его при временных ошибках сервера.
+
+    :param client: Клиент httpx.AsyncClient.
+    :param params: Словарь с параметрами запроса.
+    :return: Ответ сервера с успешным статусом.
+
+    :raises RuntimeError: Если сервер вернул ошибку или временная ошибка повторилась 5 раз.
+    """
+    for attempt in range(RETRIES + 1):
+        http_response = await client.get(API_URL, params = params)
+        if http_response.status_code not in RETRY_STATUSES or attempt == RETRIES:
+            break
+        # Экспоненциальная задержка перед повтором: 0.2, 0.4, 0.8... секунд
+        await asyncio.sleep(BACKOFF_FACTOR * 2 ** attempt)
+
+    # Open-Meteo возвращает причину ошибки в теле ответа
+    if http_response.is_error:
+        raise RuntimeError(f"Ошибка Open-Meteo API ({http_response.status_code}): {http_response.text}")
+    return http_response
+
+async def _fetch_all(param_list):
+    """
+    Параллельно выполняет запросы к Open-Meteo API для каждого набора параметров.
+
+    :param param_list: Список словарей с параметрами запросов.
+    :return: Список объектов WeatherApiResponse в порядке параметров.
+    """
+    # Один клиент на все запросы, с повтором запроса в случае ошибок соединения
+    transport = httpx.AsyncHTTPTransport(retries = RETRIES)
+    async with httpx.AsyncClient(transport = transport, timeout = 30) as client:
+        http_responses = await asyncio.gather(*(_get_with_retry(client, params) for params in param_list))
+
+    responses = []
+    for http_response in http_responses:
+        responses.extend(_decode_responses(http_response.content))
+    return responses
+
+def _responses_to_dataframe(responses):
+    """
+    Собирает ежедневные данные из ответов Open-Meteo API в один DataFrame.
+
+    :param responses: Список объектов WeatherApiResponse в хронологическом порядке.
+    :return: DataFrame с данными о погоде.
+    """
+    # Process daily data. The order of variables needs to be the same as requested.
+    dailies = [response.Daily() for response in responses]
+    dates = [
+        pd.date_range(
+            start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
+            end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
+            freq = pd.Timedelta(seconds = daily.Interval()),
+            inclusive = "left"
+        )
+        for daily in dailies
+    ]
+    daily_data = {"date": dates[0].append(dates[1:])}
+
+    # ValuesAsNumpy возвращает доступное только для чтения np.frombuffer-представление
+    # буфера ответа. Представления всех ответов копируются по каждому показателю один раз
+    # в новый массив, поэтому столбцы DataFrame доступны для записи при любом числе окон
+    values = {
+        name: np.concatenate([daily.Variables(i).ValuesAsNumpy() for daily in dailies])
+        for i, name in enumerate(DAILY_VARIABLES)
     }
-    responses = openmeteo.weather_api(url, params=params)
+
+    # weather_code хранится как целое (Int16 допускает пропуски), остальные показатели - float32.
+    # Каждый столбец - отдельный непрерывный буфер, чтобы свёртки по столбцам читали память подряд
+    daily_data["weather_code"] = pd.array(values.pop("weather_code"), dtype = "Int16")
+    for name, value in values.items():
+        daily_data[name] = np.ascontiguousarray(value, dtype = np.float32)
+
+    # copy=False: столбцы не копируются повторно и не объединяются в общий блок
+    return pd.DataFrame(data = daily_data, copy = False)
+
+@functools.lru_cache(maxsize = 32)
+def _read_cache(cache_path, modified_time):
+    """
+    Читает DataFrame из файла кэша, повторные чтения той же версии файла берутся из памяти.
+
+    :param cache_path: Путь к parquet-файлу кэша.
+    :param modified_time: Время изменения файла, входит в ключ, чтобы перезапись файла сбрасывала кэш.
+    :return: DataFrame с данными о погоде.
+    """
+    return pd.read_parquet(cache_path)
+
+def get_weather_data(months):
+    """
+    Получает исторические данные о погоде за указанные месяцы.
+
+    Период разбивается на помесячные окна, запросы по которым
+    выполняются параллельно. Результат кэшируется на диске на час
+    и в памяти процесса, каждый вызов возвращает отдельную копию DataFrame.
+
+    :param months: Количество месяцев, за которые необходимо получить данные о погоде.
+    :return: DataFrame с данными о погоде.
+
+    :raises ValueError: Если количество месяцев не положительное.
+    """
+    if months <= 0:
+        raise ValueError(f"Количество месяцев должно быть положительным, получено {months}.")
+
+    # Определяем границы помесячных окон, окна не пересекаются
+    today = datetime.now()
+    window_starts = [today - relativedelta(months=months - i) for i in range(months)]
+    window_ends = [start - timedelta(days=1) for start in window_starts[1:]] + [today]
+
+    # Устанавливаем параметры запросов для города Санкт-Петербург
+    param_list = [
+        _build_params(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), 59.9375, 30.308611)
+        for start, end in zip(window_starts, window_ends)
+    ]
+
+    # Если DataFrame по тем же параметрам уже сохранён и не устарел, берём его с диска
+    cache_key = hashlib.sha1(json.dumps(param_list, sort_keys=True).encode()).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"weather_{cache_key}.parquet")
+    if os.path.exists(cache_path):
+        modified_time = os.path.getmtime(cache_path)
+        if time.time() - modified_time < CACHE_EXPIRE_AFTER:
+            print("Данные о погоде загружены из кэша.")
+            return _read_cache(cache_path, modified_time).copy()
+
+    responses = asyncio.run(_fetch_all(param_list))
 
     # Обрабатываем полученные данные
     response = responses[0]
@@ -126,29 +363,19 @@ def get_weather_data(months):
     print(f"Timezone {response.Timezone()} {response.TimezoneAbbreviation()}")
     print(f"Timezone difference to GMT+0 {response.UtcOffsetSeconds()} s")
 
-    # Process daily data. The order of variables needs to be the same as requested.
-    daily = response.Daily()
-    daily_weather_code = daily.Variables(0).ValuesAsNumpy()
-    daily_temperature_2m_max = daily.Variables(1).ValuesAsNumpy()
-    daily_temperature_2m_min = daily.Variables(2).ValuesAsNumpy()
-    daily_apparent_temperature_max = daily.Variables(3).ValuesAsNumpy()
-    daily_apparent_temperature_min = daily.Variables(4).ValuesAsNumpy()
-    daily_wind_speed_10m_max = daily.Variables(5).ValuesAsNumpy()
-
-    daily_data = {"date": pd.date_range(
-        start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-        end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-        freq = pd.Timedelta(seconds = daily.Interval()),
-        inclusive = "left"
-    )}
-    daily_data["weather_code"] = daily_weather_code
-    daily_data["temperature_2m_max"] = daily_temperature_2m_max
-    daily_data["temperature_2m_min"] = daily_temperature_2m_min
-    daily_data["apparent_temperature_max"] = daily_apparent_temperature_max
-    daily_data["apparent_temperature_min"] = daily_apparent_temperature_min
-    daily_data["wind_speed_10m_max"] = daily_wind_speed_10m_max
-
-    daily_dataframe = pd.DataFrame(data = daily_data)
+    daily_dataframe = _responses_to_dataframe(responses)
+
+    # Сохраняем DataFrame в кэш для повторных запусков. Файл записывается во временный
+    # и атомарно заменяет старый, чтобы прерванная запись не оставила повреждённый кэш
+    os.makedirs(CACHE_DIR, exist_ok = True)
+    daily_dataframe.to_parquet(f"{cache_path}.tmp")
+    os.replace(f"{cache_path}.tmp", cache_path)
+
+    # Удаляем устаревшие файлы кэша: ключ зависит от дат периода, поэтому каждый день создаётся новый файл
+    for file_name in os.listdir(CACHE_DIR):
+        file_path = os.path.join(CACHE_DIR, file_name)
+        if file_name.startswith("weather_") and time.time() - os.path.getmtime(file_path) >= CACHE_EXPIRE_AFTER:
+            os.remove(file_path)
 
     return daily_dataframe
 
@@ -168,85 +395,86 @@ def db_connect(db_user, db_password, db_host, db_port, db_name):
 
     return engine
 
-def create_table(engine, table_name):
+def create_table(connection):
     """
-    Создает таблицу в базе данных, если она не существует.
+    Создает таблицу daily_weather в базе данных, если она не существует.
 
-    :param engine: Объект подключения к базе данных.
-    :param table_name: Название таблицы, которую необходимо создать.
+    Таблица в устаревшем формате pandas.to_sql (столбец date не типа DATE или нет
+    первичного ключа), сохранившаяся в томе pg_data, удаляется и создаётся заново.
+    При других отличиях схемы таблица остаётся как есть, выводится предупреждение.
+
+    :param connection: Подключение к базе данных с открытой транзакцией.
 
     :raises RuntimeError: Если таблица не была создана.
     """
-    # DDL запрос
-    ddl_query = text(f'''
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            date DATE PRIMARY KEY,
-            weather_code INTEGER,
-            temperature_2m_max FLOAT,
-            temperature_2m_min FLOAT,
-            apparent_temperature_max FLOAT,
-            apparent_temperature_min FLOAT,
-            wind_speed_10m_max FLOAT
-        );
-    ''')
-
-    # Выполнение DDL запроса для создания таблицы
+    # Проверка схемы существующей таблицы
+    columns = dict(connection.execute(_TABLE_COLUMNS, {"name": TABLE_NAME}).all())
+    if columns:
+        has_primary_key = connection.execute(_HAS_PRIMARY_KEY, {"name": TABLE_NAME}).scalar()
+        if columns.get("date") != "date" or not has_primary_key:
+            print(f"""Таблица '{TABLE_NAME}' создана в устаревшем формате и будет создана заново.
+            Прежняя схема: {columns}, первичный ключ: {"есть" if has_primary_key else "нет"}.
+            """)
+            connection.execute(_DROP_DAILY)
+        elif columns != _DAILY_COLUMN_TYPES:
+            print(f"""Предупреждение: схема таблицы '{TABLE_NAME}' отличается от ожидаемой: {columns}.
+            Таблица оставлена без изменений.
+            """)
+
+    # Выполнение DDL запроса для создания таблицы. Точка сохранения позволяет
+    # продолжить общую транзакцию после ошибки DDL
     print("Создание таблицы в базе данных...")
     try:
-        with engine.connect() as connection:
-            connection.execute(ddl_query)
-            connection.commit()
-            connection.close()
+        with connection.begin_nested():
+            connection.execute(_DDL_DAILY)
     except Exception as e:
         print(f"Ошибка при создании таблицы: {e}")
 
     # Проверка, что таблица была создана
-    with engine.connect() as connection:
-        result = connection.execute(text(f"""
-            SELECT EXISTS (
-                SELECT 1
-                FROM information_schema.tables
-                WHERE table_name = '{table_name}'
-            );
-        """))
-        connection.commit()
-        connection.close()
-
-        # Получение результата проверки
-        table_exists = result.scalar()
-
-        if not table_exists:
-            raise RuntimeError(f"""Ошибка: Таблица '{table_name}' не была создана.
-            Проверьте параметры запроса.
-            """)
-        else:
-            print(f"Таблица '{table_name}' успешно создана.")
-            return "Success"
+    table_exists = connection.execute(_CHECK_TABLE, {"name": TABLE_NAME}).scalar()
 
-def load_data(daily_dataframe, table_name, engine):
+    if not table_exists:
+        raise RuntimeError(f"""Ошибка: Таблица '{TABLE_NAME}' не была создана.
+        Проверьте параметры запроса.
+        """)
+    else:
+        print(f"Таблица '{TABLE_NAME}' успешно создана.")
+        return "Success"
+
+def load_data(daily_dataframe, connection):
     """
-    Загружает данные о погоде в таблицу базы данных.
+    Загружает данные о погоде в таблицу daily_weather.
+
+    Данные фиксируются вместе с транзакцией переданного подключения.
 
     :param daily_dataframe: DataFrame с данными о погоде.
-    :param table_name: Название таблицы, в которую будут записаны данные.
-    :param engine: Объект подключения к базе данных.
+    :param connection: Подключение к базе данных с открытой транзакцией.
 
     :raises ValueError: Если количество записанных записей не совпадает с ожидаемым.
     """
     print("Запись данных в таблицу daily_weather...")
-    daily_dataframe.to_sql(table_name, engine, if_exists='replace', index=False)
 
-    # Проверка, что все данные записались в таблицу
-    with engine.connect() as connection:
-        # Получение количества строк в таблице после вставки
-        result = connection.execute(text(f"SELECT COUNT(*) FROM {table_name};"))
-        row_count = result.scalar()  # Получаем одно значение
-
-    # Сравнение количества записей
+    # Сериализуем DataFrame в CSV в памяти. Колонки выбираются явно в порядке списка столбцов COPY,
+    # даты переводим в часовой пояс запроса, пропуски записываются как NULL
+    buffer = io.StringIO()
+    daily_dataframe[list(_DAILY_COLUMN_TYPES)].assign(
+        date = daily_dataframe['date'].dt.tz_convert(TIMEZONE)
+    ).to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d")
+    buffer.seek(0)
+
+    # Очищаем таблицу и загружаем данные одной командой COPY, не пересоздавая таблицу.
+    # COPY выполняется курсором psycopg2 того же подключения, в той же транзакции
+    connection.execute(_TRUNCATE_DAILY)
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(_COPY_DAILY, buffer)
+        # Количество записанных строк COPY возвращает сам, без отдельного SELECT COUNT(*)
+        row_count = cursor.rowcount
+
+    # Сравнение количества записей, при ошибке транзакция будет отменена
     if row_count != len(daily_dataframe):
         raise ValueError(f"Ошибка: записано {row_count} записей, ожидается {len(daily_dataframe)}.")
 
-    print(f"Данные успешно записаны в таблицу {table_name}.")
+    print(f"Данные успешно записаны в таблицу {TABLE_NAME}.")
     return "Success"
 
 def ask_user():
@@ -269,68 +497,42 @@ def ask_user():
             print("Ошибка: введите только 'y' или 'n'. Попробуйте снова.")
             continue
 
-def get_dates(daily_dataframe):
+def _format_dates(dates):
     """
-    Получает три даты с максимальными значениями температуры и скорости ветра из DataFrame.
+    Форматирует даты в строки вида "день месяц год" с месяцем в родительном падеже.
 
-    Функция принимает DataFrame с данными о погоде, преобразует столбец дат в формат datetime,
-    находит три максимальных значения для температуры и скорости ветра,
-    объединяет результаты и возвращает отформатированные даты в виде строки в родительном падеже.
+    :param dates: pd.Series с датами в формате datetime.
+    :return: Список отформатированных дат (например, "3 сентября 2024").
+    """
+    # Форматируем даты с заменой месяцев, номера месяцев переводим в названия индексацией numpy
+    days = dates.dt.day.to_numpy()
+    month_names = _MONTHS_RU[dates.dt.month.to_numpy()]
+    years = dates.dt.year.to_numpy()
 
-    Параметры:
-    ----------
-    daily_dataframe : pd.DataFrame
-        DataFrame с колонками 'date', 'temperature_2m_max' и 'wind_speed_10m_max',
-        где 'date' должен быть в формате строки с часовым поясом.
+    # Выводим только отформатированные даты без скобок и кавычек
+    formatted_dates = [f"{day} {month} {year}" for day, month, year in zip(days, month_names, years)]
+    return formatted_dates
 
-    Returns:
-    -------
-    list
-        Список строк с отформатированными датами в формате "день месяц год"
-        (например, "3 сентября 2024") без скобок и кавычек.
+def get_weather_stats(connection):
     """
-    # Преобразовываем столбец date в datetime
-    daily_dataframe['date'] = pd.to_datetime(daily_dataframe['date'])
-
-    # Находим 3 даты с максимальным значением temperature_2m_max
-    top_temp_dates = daily_dataframe.nlargest(3, 'temperature_2m_max')[['date', 'temperature_2m_max']]
-
-    # Находим 3 даты с максимальным значением wind_speed_10m_max
-    top_wind_dates = daily_dataframe.nlargest(3, 'wind_speed_10m_max')[['date', 'wind_speed_10m_max']]
-
-    # Объединяем результаты
-    top_dates = pd.concat([top_temp_dates, top_wind_dates]).drop_duplicates(subset='date').nlargest(3, 'temperature_2m_max')
-
-    # Словарь для замены месяцев
-    months = {
-        1: "января",
-        2: "февраля",
-        3: "марта",
-        4: "апреля",
-        5: "мая",
-        6: "июня",
-        7: "июля",
-        8: "августа",
-        9: "сентября",
-        10: "октября",
-        11: "ноября",
-        12: "декабря"
-    }
-
-    # Форматируем даты с заменой месяцев
-    top_dates['formatted_date'] = top_dates['date'].apply(lambda x: f"{x.day} {months[x.month]} {x.year}")
+    Считает статистику по таблице daily_weather на стороне базы данных одним запросом.
 
-    # Выводим только отформатированные даты без скобок и кавычек
-    formatted_dates = top_dates['formatted_date'].tolist()
+    :param connection: Подключение к базе данных.
+    :return: Кортеж из количества солнечных дней (weather_code 0, 1), количества дней
+        с температурой от 20 градусов и списка из трёх отформатированных дат с самой высокой
+        температурой среди дней с самой высокой температурой и самым сильным ветром.
+    """
+    rows = connection.execute(_STATS_DAILY).all()
 
-    return formatted_dates
+    sunny_days, hot_days = rows[0].sunny_days, rows[0].hot_days
+    dates = pd.Series(pd.to_datetime([row.date for row in rows if row.date is not None]))
+    return sunny_days, hot_days, _format_dates(dates)
 
 if __name__ == "__main__":
 
     # Определяем переменные
     CONTAINER_NAME = "postgres_weather" # Название Docker контейнера
     DB_NAME = "postgres" # Название базы данных PostgreSQL
-    TABLE_NAME = "daily_weather"
     MONTHS = 2 # Количество месяцев для запроса данных о погоде
     DB_HOST = "localhost" # Хост БД
     DB_PORT = "5432" # Порт БД по умоланию
@@ -351,22 +553,19 @@ if __name__ == "__main__":
     db_engine = db_connect(DB_USER, DB_PASSWORD, DB_HOST, BD_PORT_A, DB_NAME)
     print(f"Подключение к базе {DB_NAME} успешно установлено.")
 
-    # Создаём таблицу для записи данных в базе
-    create_table(db_engine, TABLE_NAME)
-
-    # Запись данных в таблицу Postgres
-    load_data(received_daily_dataframe, TABLE_NAME, db_engine)
+    # Создание таблицы, запись данных и подсчёт статистики в одной транзакции
+    with db_engine.begin() as db_connection:
+        # Создаём таблицу для записи данных в базе
+        create_table(db_connection)
 
-    # Считаем количество солнечных дней за период
-    count = received_daily_dataframe[received_daily_dataframe['weather_code'].isin([0, 1])].shape[0]
-    print(f"Количество солнечных дней (weather_code 0, 1) в запрошенном периоде - {count}")
+        # Запись данных в таблицу Postgres
+        load_data(received_daily_dataframe, db_connection)
 
-    # Считаем количество дней, когда температура была выше 20 градусов по Цельсию
-    count = received_daily_dataframe[received_daily_dataframe['temperature_2m_max'] >= 20].shape[0]
-    print(f"количество дней, когда температура была выше 20 градусов по Цельсию в запрошенном периоде - {count}")
+        # Считаем статистику по загруженным данным на стороне базы данных
+        sunny_days, hot_days, formatted_dates = get_weather_stats(db_connection)
 
-    # Получаем 3 дня, когда была самая высокая температура и самый сильный ветер
-    formatted_dates = get_dates(received_daily_dataframe)
+    print(f"Количество солнечных дней (weather_code 0, 1) в запрошенном периоде - {sunny_days}")
+    print(f"количество дней, когда температура была выше 20 градусов по Цельсию в запрошенном периоде - {hot_days}")
     print("3 дня, когда была самая высокая температура и самый сильный ветер - " + ", ".join(formatted_dates))
 
     # Информируем пользователя о возможности подключиться к базе
@@ -4,6 +4,7 @@
 основной скрипт внутри этого виртуального окружения.
 """
 
+import hashlib
 import os
 import subprocess
 import venv
@@ -20,15 +21,39 @@ def create_virtualenv(venv_path):
     print(f"Виртуальное окружение '{venv_path}' создано.")
 
 # Функция для установки зависимостей из requirements.txt
-def install_requirements(venv_python):
+def install_requirements(venv_python, venv_path):
     """
     Устанавливает зависимости из файла requirements.txt в указанном виртуальном окружении.
 
+    Установка пропускается, если зависимости из текущей версии requirements.txt
+    уже были установлены в это окружение.
+
     :param venv_python: Путь к интерпретатору Python в виртуальном окружении.
+    :param venv_path: Путь к папке виртуального окружения.
     """
+    # Проверка, установлены ли уже зависимости из текущего requirements.txt
+    with open("requirements.txt", "rb") as file:
+        requirements_hash = hashlib.sha256(file.read()).hexdigest()
+    sentinel_path = os.path.join(venv_path, ".installed")
+    if os.path.exists(sentinel_path):
+        with open(sentinel_path, encoding="utf-8") as file:
+            if file.read().strip() == requirements_hash:
+                print("Зависимости из 'requirements.txt' уже установлены.")
+                return
+
+    # Общий кэш пакетов pip, чтобы повторная установка не скачивала их заново
+    env = {**os.environ, "PIP_CACHE_DIR": os.path.abspath(".pip-cache"), "PIP_DISABLE_PIP_VERSION_CHECK": "1"}
+
     print("Установка зависимостей из 'requirements.txt'...")
-    subprocess.run([venv_python, "-m", "pip", "install", "--upgrade", "pip"], stdout=subprocess.DEVNULL, check=True)
-    subprocess.run([venv_python, "-m", "pip", "install", "-r", "requirements.txt"], stdout=subprocess.DEVNULL, check=True)
+    # Обновляем pip, только если его версия ниже 24
+    pip_version = subprocess.check_output([venv_python, "-m", "pip", "--version"], env=env, text=True).split()[1]
+    if int(pip_version.split(".")[0]) < 24:
+        subprocess.run([venv_python, "-m", "pip", "install", "--upgrade", "pip"], stdout=subprocess.DEVNULL, env=env, check=True)
+    subprocess.run([venv_python, "-m", "pip", "install", "--prefer-binary", "-r", "requirements.txt"],
+        stdout=subprocess.DEVNULL, env=env, check=True)
+
+    with open(sentinel_path, "w", encoding="utf-8") as file:
+        file.write(requirements_hash)
     print("Все зависимости успешно установлены.")
 
 if __name__ == "__main__":
@@ -49,7 +74,7 @@ if __name__ == "__main__":
         curr_venv_python = os.path.join(VENV_DIR, "bin", "python")
 
     # Устанавливаем зависимости
-    install_requirements(curr_venv_python)
+    install_requirements(curr_venv_python, VENV_DIR)
 
     # Запускаем основной код в виртуальном окружении
     print("Запуск основного скрипта внутри виртуального окружения...")